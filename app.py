@@ -3,16 +3,27 @@ SQL Database Chat Application
 A professional Streamlit application for interacting with SQL databases using natural language.
 """
 
+import asyncio
+import hashlib
+import os
+import threading
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from collections import OrderedDict
 from pathlib import Path
 from langchain_community.agent_toolkits import create_sql_agent
+from langchain_community.cache import SQLiteCache
 from langchain_community.utilities import SQLDatabase
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
 import sqlite3
+from langchain_core.agents import AgentAction
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.globals import set_llm_cache
 from langchain_groq import ChatGroq
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Awaitable, Callable, Iterator
 from datetime import datetime
 
 # Configure logging
@@ -25,19 +36,36 @@ logger = logging.getLogger(__name__)
 # Constants
 LOCALDB = "USE_LOCALDB"
 MYSQL = "USE_MYSQL"
+_DB_TYPE_BY_LABEL = {
+    "🗄️ Use SQLite Database (student.db)": LOCALDB,
+    "🔗 Connect to MySQL Database": MYSQL
+}
 DEFAULT_MODEL = "llama-3.1-70b-versatile"
 CACHE_TTL = 7200  # 2 hours in seconds
+MAX_BATCH_CONCURRENCY = 4  # parallel agent runs for multi-line questions
+HISTORY_WINDOW = 10  # history is trimmed to this many messages once it passes twice this
+QA_CACHE_SIZE = 64  # answers remembered per session
+AGENT_STOPPED_PREFIX = "Agent stopped due to"  # AgentExecutor early-stop answer
+LLM_CACHE_PATH = Path(__file__).parent / ".langchain_cache.db"
 
-# Page configuration
-st.set_page_config(
-    page_title="SQL Database Chat Assistant",
-    page_icon="🤖",
-    layout="wide",
-    initial_sidebar_state="expanded"
+# Per-connection SQLite tuning. journal_mode=WAL is intentionally not applied:
+# it is stored in the file header and a mode=ro connection cannot switch it.
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",       # ~20 MB page cache
+    "PRAGMA mmap_size=268435456",     # 256 MB memory-mapped I/O
+    "PRAGMA busy_timeout=5000",
+    # Keep the file lock between queries instead of re-taking it each time.
+    # On a mode=ro connection this is a SHARED lock: other processes can
+    # still read student.db but cannot write to it, so rebuilding it
+    # (python sqlite.py) fails with "database is locked" until the app stops.
+    "PRAGMA locking_mode=EXCLUSIVE",
 )
 
-# Custom CSS for better UI
-st.markdown("""
+# Static page content. Streamlit drops any element a rerun does not emit,
+# so these are still rendered every run, just not rebuilt.
+_CSS = """
     <style>
     .main-header {
         font-size: 2.5rem;
@@ -66,7 +94,29 @@ st.markdown("""
         color: #721c24;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+
+_ABOUT = (
+    "**SQL Chat Assistant v2.0**\n\n"
+    "This application uses LangChain agents with Groq LLMs to enable "
+    "natural language interaction with SQL databases.\n\n"
+    "**Features:**\n"
+    "- Natural language queries\n"
+    "- SQLite & MySQL support\n"
+    "- Real-time responses\n"
+    "- Secure connections"
+)
+
+# Page configuration
+st.set_page_config(
+    page_title="SQL Database Chat Assistant",
+    page_icon="🤖",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Custom CSS for better UI
+st.markdown(_CSS, unsafe_allow_html=True)
 
 # Title and description
 st.markdown('<p class="main-header">🤖 SQL Database Chat Assistant</p>', unsafe_allow_html=True)
@@ -75,23 +125,25 @@ st.markdown("""
     Ask questions in plain English and get instant insights from your SQL database.
 """)
 
+@st.cache_data(ttl=60, show_spinner=False)
+def get_footer_timestamp() -> str:
+    """Return the footer timestamp, recomputed at most once a minute."""
+    return datetime.now().strftime('%Y-%m-%d %H:%M')
+
+
 # Sidebar Configuration
 with st.sidebar:
     st.header("⚙️ Configuration")
     
     # Database Selection
     st.subheader("📊 Database Connection")
-    radio_opt = [
-        "🗄️ Use SQLite Database (student.db)",
-        "🔗 Connect to MySQL Database"
-    ]
     selected_opt = st.radio(
         label="Select Database Type",
-        options=radio_opt,
+        options=list(_DB_TYPE_BY_LABEL),
         help="Choose between local SQLite or remote MySQL database"
     )
     
-    db_type = MYSQL if radio_opt.index(selected_opt) == 1 else LOCALDB
+    db_type = _DB_TYPE_BY_LABEL[selected_opt]
     
     # MySQL Configuration
     mysql_config = {}
@@ -138,28 +190,22 @@ with st.sidebar:
     with col1:
         if st.button("🔄 Reconnect", use_container_width=True):
             st.cache_resource.clear()
+            st.cache_data.clear()
+            st.session_state.pop("qa_cache", None)
             st.rerun()
     with col2:
         if st.button("🗑️ Clear Chat", use_container_width=True):
             st.session_state["messages"] = []
+            st.session_state.pop("qa_cache", None)
             st.rerun()
     
     # About Section
     st.markdown("---")
     st.subheader("ℹ️ About")
-    st.info(
-        "**SQL Chat Assistant v2.0**\n\n"
-        "This application uses LangChain agents with Groq LLMs to enable "
-        "natural language interaction with SQL databases.\n\n"
-        "**Features:**\n"
-        "- Natural language queries\n"
-        "- SQLite & MySQL support\n"
-        "- Real-time responses\n"
-        "- Secure connections"
-    )
+    st.info(_ABOUT)
     
     # Footer
-    st.caption(f"Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    st.caption(f"Last updated: {get_footer_timestamp()}")
 
 
 # Validation Functions
@@ -178,7 +224,29 @@ def validate_inputs() -> tuple[bool, Optional[str]]:
     return True, None
 
 
+def get_database_key() -> str:
+    """Return a string identifying the selected database, used as a cache key."""
+    if db_type == MYSQL:
+        return f"{MYSQL}:{mysql_config['user']}@{mysql_config['host']}/{mysql_config['database']}"
+    return LOCALDB
+
+
 # Database Configuration
+def apply_sqlite_pragmas(dbapi_connection: sqlite3.Connection, connection_record: Any) -> None:
+    """
+    Apply SQLITE_PRAGMAS to a freshly opened SQLite connection.
+    
+    Registered as an SQLAlchemy "connect" listener. With locking_mode=EXCLUSIVE
+    the read-only connection keeps its SHARED lock, so while the app is running
+    other processes can read the database but not write to it (stop the app
+    before rebuilding student.db).
+    """
+    for pragma in SQLITE_PRAGMAS:
+        dbapi_connection.execute(pragma)
+    # The SHARED lock is only taken on the first read; take it now.
+    dbapi_connection.execute("SELECT count(*) FROM sqlite_master").fetchone()
+
+
 @st.cache_resource(ttl=CACHE_TTL, show_spinner=False)
 def configure_database(
     db_uri: str,
@@ -209,15 +277,36 @@ def configure_database(
                 st.error(f"❌ Database file not found: {db_path}")
                 return None
             
-            creator = lambda: sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
-            engine = create_engine("sqlite:///", creator=creator)
+            # Small pool of read-only connections; each holds only a SHARED
+            # lock, so concurrent sessions and batch tool calls can coexist.
+            # check_same_thread=False lets pooled connections move between
+            # threads; each is still used by one thread at a time.
+            creator = lambda: sqlite3.connect(
+                f"file:{db_path}?mode=ro", uri=True, check_same_thread=False
+            )
+            engine = create_engine(
+                "sqlite:///",
+                creator=creator,
+                poolclass=QueuePool,
+                pool_size=MAX_BATCH_CONCURRENCY + 1,
+                max_overflow=5
+            )
+            event.listen(engine, "connect", apply_sqlite_pragmas)
             logger.info(f"Connected to SQLite database: {db_path}")
             
         elif db_uri == MYSQL:
             connection_string = (
-                f"mysql+mysqlconnector://{user}:{password}@{host}/{database}"
+                f"mysql+pymysql://{user}:{password}@{host}/{database}"
+            )
+            engine = create_engine(
+                connection_string,
+                pool_size=5,
+                max_overflow=10,
+                pool_pre_ping=True,
+                pool_recycle=1800,
+                pool_timeout=30,
+                connect_args={"connect_timeout": 5}
             )
-            engine = create_engine(connection_string)
             logger.info(f"Connected to MySQL database: {database}@{host}")
         
         return SQLDatabase(engine)
@@ -232,7 +321,54 @@ def configure_database(
         return None
 
 
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_table_names(_db: SQLDatabase, db_key: str) -> list[str]:
+    """
+    Return the usable table names, cached per database.
+    
+    Args:
+        _db: SQLDatabase instance (prefixed with _ to prevent hashing)
+        db_key: Database identifier from get_database_key()
+    """
+    return list(_db.get_usable_table_names())
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_table_schema(_db: SQLDatabase, db_key: str, table: str) -> str:
+    """
+    Return the CREATE statement and sample rows for a table, cached per database.
+    
+    Args:
+        _db: SQLDatabase instance (prefixed with _ to prevent hashing)
+        db_key: Database identifier from get_database_key()
+        table: Table name
+    """
+    return _db.get_table_info([table])
+
+
 # LLM Initialization
+@st.cache_resource(show_spinner=False)
+def configure_llm_cache() -> None:
+    """
+    Install a process-wide LangChain LLM cache.
+    
+    Uses Redis when REDIS_URL is set (shared between replicas), otherwise a
+    local SQLite file next to the app.
+    """
+    try:
+        redis_url = os.environ.get("REDIS_URL")
+        if redis_url:
+            import redis
+            from langchain_community.cache import RedisCache
+            set_llm_cache(RedisCache(redis.Redis.from_url(redis_url)))
+            logger.info("Using Redis LLM cache")
+        else:
+            set_llm_cache(SQLiteCache(database_path=str(LLM_CACHE_PATH)))
+            logger.info(f"Using SQLite LLM cache: {LLM_CACHE_PATH}")
+    except Exception as e:
+        logger.warning(f"LLM cache disabled: {str(e)}")
+
+
 @st.cache_resource(show_spinner=False)
 def initialize_llm(_api_key: str, model: str) -> Optional[ChatGroq]:
     """
@@ -261,33 +397,199 @@ def initialize_llm(_api_key: str, model: str) -> Optional[ChatGroq]:
 
 
 # Agent Creation
-def create_agent(llm: ChatGroq, database: SQLDatabase, verbose: bool = False, max_iter: int = 10):
+@st.cache_resource(ttl=CACHE_TTL, show_spinner=False)
+def create_agent(
+    _llm: ChatGroq,
+    _database: SQLDatabase,
+    model: str,
+    db_id: int,
+    max_iter: int = 10
+):
     """
-    Create and return SQL agent.
+    Create and return SQL agent, reused across reruns.
     
     Args:
-        llm: Language model instance
-        database: SQLDatabase instance
-        verbose: Enable verbose output
+        _llm: Language model instance (prefixed with _ to prevent hashing)
+        _database: SQLDatabase instance (prefixed with _ to prevent hashing)
+        model: Model name of _llm, used as part of the cache key
+        db_id: id() of _database, so a database rebuilt by configure_database
+            (TTL expiry or Reconnect) gets a new agent
         max_iter: Maximum iterations for agent
     
     Returns:
         SQL agent instance
     """
-    try:
-        agent = create_sql_agent(
-            llm=llm,
-            db=database,
-            verbose=verbose,
-            agent_type="openai-tools",
-            handle_parsing_errors=True,
-            max_iterations=max_iter
+    agent = create_sql_agent(
+        llm=_llm,
+        db=_database,
+        verbose=False,
+        agent_type="openai-tools",
+        handle_parsing_errors=True,
+        max_iterations=max_iter,
+        # Call the model via agenerate, which reads the LLM cache; it still
+        # streams tokens on a miss when astream_events is listening.
+        # Forwarded by create_sql_agent to the RunnableMultiActionAgent.
+        stream_runnable=False
+    )
+    logger.info("SQL agent created successfully")
+    return agent
+
+
+# Concurrent Startup
+def run_in_script_thread(func: Callable, *args) -> Awaitable:
+    """
+    Run func in a worker thread that shares the current Streamlit script context.
+    
+    The context is needed for st.cache_resource and st.error calls made from
+    the worker thread.
+    """
+    ctx = get_script_run_ctx()
+    
+    def target():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(*args)
+    
+    return asyncio.to_thread(target)
+
+
+async def initialize_components() -> tuple[Optional[ChatGroq], Optional[SQLDatabase]]:
+    """Initialize the LLM and connect to the database at the same time."""
+    if db_type == MYSQL:
+        db_args = (
+            db_type,
+            mysql_config['host'],
+            mysql_config['user'],
+            mysql_config['password'],
+            mysql_config['database']
         )
-        logger.info("SQL agent created successfully")
-        return agent
-    except Exception as e:
-        logger.error(f"Agent creation error: {str(e)}")
-        raise
+    else:
+        db_args = (db_type,)
+    
+    llm, db = await asyncio.gather(
+        run_in_script_thread(initialize_llm, api_key, selected_model),
+        run_in_script_thread(configure_database, *db_args)
+    )
+    return llm, db
+
+
+# Verbose Tracing
+class AgentTraceHandler(BaseCallbackHandler):
+    """Buffer the agent's tool calls in memory so verbose mode can show them after the run."""
+    
+    def __init__(self):
+        self.steps: list[str] = []
+    
+    def on_agent_action(self, action: AgentAction, **kwargs: Any) -> None:
+        self.steps.append(f"🔧 **{action.tool}**: `{action.tool_input}`")
+    
+    def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        self.steps.append(f"```\n{output}\n```")
+
+
+def run_config(tracer: Optional[AgentTraceHandler]) -> Dict[str, Any]:
+    """Return the Runnable config for an agent call, attaching tracer if given."""
+    return {"callbacks": [tracer]} if tracer else {}
+
+
+def render_trace(tracer: Optional[AgentTraceHandler]) -> None:
+    """Show the buffered agent steps in a collapsed expander."""
+    if tracer and tracer.steps:
+        with st.expander("🔍 Agent reasoning", expanded=False):
+            st.markdown("\n\n".join(tracer.steps))
+
+
+# Answer Cache
+def answer_cache_key(query: str) -> str:
+    """Return the answer-cache key for a question under the current settings."""
+    normalized = "\n".join([
+        get_database_key(),
+        selected_model,
+        str(max_iterations),
+        query.strip().lower()
+    ])
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+
+def get_cached_answer(query: str) -> Optional[str]:
+    """Return this session's previous answer to query, if any."""
+    qa_cache = st.session_state.setdefault("qa_cache", OrderedDict())
+    key = answer_cache_key(query)
+    if key in qa_cache:
+        qa_cache.move_to_end(key)
+        return qa_cache[key]
+    return None
+
+
+def cache_answer(query: str, answer: str) -> None:
+    """
+    Remember answer for query, keeping at most QA_CACHE_SIZE entries.
+    
+    Answers from an agent that hit its iteration or time limit are not kept,
+    so asking again retries the question.
+    """
+    if answer.startswith(AGENT_STOPPED_PREFIX):
+        return
+    qa_cache = st.session_state.setdefault("qa_cache", OrderedDict())
+    key = answer_cache_key(query)
+    qa_cache[key] = answer
+    qa_cache.move_to_end(key)
+    while len(qa_cache) > QA_CACHE_SIZE:
+        qa_cache.popitem(last=False)
+
+
+# Response Streaming
+def stream_agent_response(
+    agent,
+    query: str,
+    result: Dict[str, Any],
+    tracer: Optional[AgentTraceHandler] = None
+) -> Iterator[str]:
+    """
+    Yield the agent's answer token by token as the LLM emits it.
+    
+    Text from model turns that call tools is not yielded. The streamed text is
+    only a preview: the executor's final answer is stored in result["output"]
+    and is what callers should display and keep.
+    
+    Args:
+        agent: SQL agent instance
+        query: User question
+        result: Dict that receives the executor's final "output"
+        tracer: Optional handler collecting agent steps (verbose mode)
+    
+    Yields:
+        Text chunks from the chat model stream, or the agent's final
+        structured "output" if the model streamed no answer text
+    """
+    loop = asyncio.new_event_loop()
+    events = agent.astream_events({"input": query}, run_config(tracer), version="v2")
+    tool_runs = set()
+    streamed_run = None
+    try:
+        while True:
+            try:
+                event = loop.run_until_complete(events.__anext__())
+            except StopAsyncIteration:
+                break
+            if event["event"] == "on_chat_model_stream":
+                chunk = event["data"]["chunk"]
+                if chunk.tool_call_chunks:
+                    tool_runs.add(event["run_id"])
+                if not chunk.content or event["run_id"] in tool_runs:
+                    continue
+                if streamed_run not in (None, event["run_id"]):
+                    yield "\n\n"
+                streamed_run = event["run_id"]
+                yield chunk.content
+            elif event["event"] == "on_chain_end" and not event["parent_ids"]:
+                # Final AgentExecutor result; shown as-is when no answer tokens
+                # were streamed (e.g. a cache hit or a max-iterations answer)
+                result["output"] = event["data"]["output"]["output"]
+                if streamed_run is None:
+                    yield result["output"]
+    finally:
+        loop.run_until_complete(events.aclose())
+        loop.close()
 
 
 # Main Application Logic
@@ -303,28 +605,16 @@ def main():
     # Initialize components
     with st.spinner("🔄 Connecting to database and initializing AI assistant..."):
         try:
-            # Initialize LLM
-            llm = initialize_llm(api_key, selected_model)
-            if not llm:
-                st.stop()
-            
-            # Configure database
-            if db_type == MYSQL:
-                db = configure_database(
-                    db_type,
-                    mysql_config['host'],
-                    mysql_config['user'],
-                    mysql_config['password'],
-                    mysql_config['database']
-                )
-            else:
-                db = configure_database(db_type)
-            
-            if not db:
+            # Initialize LLM and database concurrently
+            configure_llm_cache()
+            llm, db = asyncio.run(initialize_components())
+            if not llm or not db:
                 st.stop()
             
             # Create agent
-            agent = create_agent(llm, db, verbose_mode, max_iterations)
+            agent = create_agent(
+                llm, db, selected_model, id(db), max_iterations
+            )
             
             # Success message
             st.success("✅ Connected successfully! Ready to answer your questions.")
@@ -337,13 +627,13 @@ def main():
     # Display database info
     with st.expander("📋 Database Information", expanded=False):
         try:
-            tables = db.get_usable_table_names()
+            tables = get_table_names(db, get_database_key())
             st.write(f"**Available Tables:** {', '.join(tables)}")
             
             if tables:
                 selected_table = st.selectbox("View Table Schema", tables)
                 if selected_table:
-                    schema = db.get_table_info([selected_table])
+                    schema = get_table_schema(db, get_database_key(), selected_table)
                     st.code(schema, language="sql")
         except Exception as e:
             st.warning(f"Could not fetch database information: {str(e)}")
@@ -357,8 +647,12 @@ def main():
             }
         ]
     
-    # Display chat history
-    for idx, msg in enumerate(st.session_state.messages):
+    # Keep the chat history bounded
+    if len(st.session_state.messages) > 2 * HISTORY_WINDOW:
+        del st.session_state.messages[:-HISTORY_WINDOW]
+    
+    # Display chat history (at most 2 * HISTORY_WINDOW messages)
+    for msg in st.session_state.messages:
         with st.chat_message(msg["role"]):
             st.write(msg["content"])
     
@@ -373,12 +667,78 @@ def main():
         with st.chat_message("user"):
             st.write(user_query)
         
+        queries = [q.strip() for q in user_query.splitlines() if q.strip()]
+        
+        # Answer several pasted questions concurrently; repeats of earlier
+        # questions come from this session's cache and are not re-run
+        if len(queries) > 1:
+            cached = {q: get_cached_answer(q) for q in queries}
+            misses = [q for q in dict.fromkeys(queries) if cached[q] is None]
+            tracers = {q: AgentTraceHandler() if verbose_mode else None for q in misses}
+            results = {}
+            if misses:
+                configs = [
+                    {**run_config(tracers[q]), "max_concurrency": MAX_BATCH_CONCURRENCY}
+                    for q in misses
+                ]
+                with st.spinner(f"🤔 Answering {len(misses)} questions..."):
+                    outputs = asyncio.run(agent.abatch(
+                        [{"input": q} for q in misses],
+                        config=configs,
+                        return_exceptions=True
+                    ))
+                results = dict(zip(misses, outputs))
+            
+            for question in queries:
+                result = results.get(question)
+                with st.chat_message("assistant"):
+                    if cached[question] is not None:
+                        response = f"**{question}**\n\n{cached[question]}"
+                        st.write(response)
+                    elif isinstance(result, Exception):
+                        response = f"❌ I encountered an error while processing \"{question}\": {str(result)}"
+                        st.error(response)
+                        logger.error(f"Query processing error: {str(result)}")
+                    else:
+                        cache_answer(question, result['output'])
+                        response = f"**{question}**\n\n{result['output']}"
+                        st.write(response)
+                        render_trace(tracers[question])
+                    st.session_state.messages.append(
+                        {"role": "assistant", "content": response}
+                    )
+            logger.info(
+                f"Processed batch of {len(queries)} queries ({len(misses)} sent to the agent)"
+            )
+            return
+        
+        # Repeated question: reuse this session's previous answer
+        cached_response = get_cached_answer(user_query)
+        if cached_response is not None:
+            with st.chat_message("assistant"):
+                st.write(cached_response)
+            st.session_state.messages.append(
+                {"role": "assistant", "content": cached_response}
+            )
+            logger.info(f"Answered query from session cache: {user_query[:50]}...")
+            return
+        
         # Generate response
         with st.chat_message("assistant"):
             with st.spinner("🤔 Analyzing your question and querying the database..."):
+                tracer = AgentTraceHandler() if verbose_mode else None
                 try:
-                    response = agent.run(user_query)
-                    st.write(response)
+                    result: Dict[str, Any] = {}
+                    placeholder = st.empty()
+                    with placeholder:
+                        st.write_stream(
+                            stream_agent_response(agent, user_query, result, tracer)
+                        )
+                    # Replace the streamed preview with the executor's answer
+                    response = result["output"]
+                    placeholder.write(response)
+                    render_trace(tracer)
+                    cache_answer(user_query, response)
                     st.session_state.messages.append(
                         {"role": "assistant", "content": response}
                     )